@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""end_point.py: microbenchmark batch get_ends against per-geometry get_end mapping"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from parenx.shared import get_base_geojson, get_end, get_ends
+
+
+def get_args():
+    """get_args: get command line parameters
+    returns:
+      parameter dict
+    """
+    parser = argparse.ArgumentParser(description="end-point extraction benchmark")
+    parser.add_argument(
+        "inpath",
+        nargs="?",
+        type=str,
+        help="GeoJSON filepath to benchmark",
+        default="data/osm_leeds.geojson",
+    )
+    parser.add_argument("--repeat", help="timing repeats", type=int, default=5)
+    args = parser.parse_args()
+    return {"inpath": args.inpath, "repeat": args.repeat}
+
+
+def main():
+    """main: time map-based and batch end-point extraction and check they agree"""
+    parameter = get_args()
+    geometry = get_base_geojson(parameter["inpath"])["geometry"]
+    repeat = parameter["repeat"]
+    expected = np.stack(geometry.map(get_end))
+    np.testing.assert_array_equal(get_ends(geometry), expected)
+    print(f"geometry\t{len(geometry)}")
+    for name, fn in [
+        ("map", lambda: np.stack(geometry.map(get_end))),
+        ("batch", lambda: get_ends(geometry)),
+    ]:
+        r = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print(f"{name}\t{r:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
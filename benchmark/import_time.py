@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""import_time.py: benchmark parenx module import time in fresh interpreters"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+MODULE = [
+    "parenx",
+    "parenx.shared",
+    "parenx.voronoi",
+    "parenx.skeletonize",
+    "parenx.tile_skeletonize",
+    "parenx.api",
+]
+
+HEAVY = ["networkx", "rasterio", "skimage", "scipy"]
+
+SCRIPT = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+print(json.dumps({{"time": t, "heavy": [k for k in {heavy} if k in sys.modules]}}))
+"""
+
+
+def get_args():
+    """get_args: get command line parameters
+    returns:
+      parameter dict
+    """
+    parser = argparse.ArgumentParser(description="parenx import time benchmark")
+    parser.add_argument("module", nargs="*", type=str, default=MODULE)
+    parser.add_argument("--repeat", help="timing repeats", type=int, default=5)
+    args = parser.parse_args()
+    return {"module": args.module, "repeat": args.repeat}
+
+
+def get_import_time(module):
+    """get_import_time: return import time and heavy modules loaded in a fresh process
+
+    args:
+      module: module name
+
+    returns:
+      import time [s] and list of heavy modules loaded
+    """
+    script = SCRIPT.format(module=module, heavy=HEAVY)
+    r = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    )
+    r = json.loads(r.stdout.strip().splitlines()[-1])
+    return r["time"], r["heavy"]
+
+
+def main():
+    """main: print best import time per module and any heavy modules loaded"""
+    parameter = get_args()
+    for module in parameter["module"]:
+        r = [get_import_time(module) for _ in range(parameter["repeat"])]
+        wall = min(v[0] for v in r)
+        heavy = ",".join(r[0][1]) or "-"
+        print(f"{module}\t{wall:.3f}s\t{heavy}")
+
+
+if __name__ == "__main__":
+    main()
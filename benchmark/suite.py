@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""suite.py: per-stage benchmark of the skeletonize, tile and Voronoi engines on the
+bundled datasets, with history and baseline comparison"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import subprocess
+import sys
+import time
+from importlib.metadata import PackageNotFoundError, version
+
+from parenx.api import PARAMETER
+from parenx.shared import get_base_geojson
+from parenx.skeletonize import skeletonize_frame
+from parenx.stage import Report
+from parenx.tile_skeletonize import skeletonize_tiles
+from parenx.voronoi import voronoi_frame
+
+DATASET = [
+    "data/rnet_princes_street.geojson",
+    "data/rnet_doncaster_rail.geojson",
+    "data/osm_leeds.geojson",
+    "data/rnet_3km_buffer.geojson",
+]
+
+ENGINE = {
+    "skeletonize": (
+        lambda v, p: skeletonize_frame(v["geometry"], p),
+        PARAMETER["skeleton"],
+    ),
+    "distance": (
+        lambda v, p: skeletonize_frame(v["geometry"], p),
+        {**PARAMETER["skeleton"], "distance": True},
+    ),
+    "tile": (skeletonize_tiles, PARAMETER["tiled"]),
+    "voronoi": (lambda v, p: voronoi_frame(v["geometry"], p), PARAMETER["voronoi"]),
+}
+
+BENCHMARK = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_args():
+    """get_args: get command line parameters
+    returns:
+      parameter dict
+    """
+    parser = argparse.ArgumentParser(description="parenx engine benchmark")
+    parser.add_argument(
+        "dataset", nargs="*", type=str, help="GeoJSON filepaths", default=DATASET
+    )
+    parser.add_argument(
+        "--engine", help="engines to run", nargs="+", choices=list(ENGINE), default=None
+    )
+    parser.add_argument("--repeat", help="timing repeats", type=int, default=1)
+    parser.add_argument(
+        "--history",
+        help="JSON lines history path",
+        type=str,
+        default=os.path.join(BENCHMARK, "history.jsonl"),
+    )
+    parser.add_argument(
+        "--baseline",
+        help="JSON baseline path",
+        type=str,
+        default=os.path.join(BENCHMARK, "baseline.json"),
+    )
+    parser.add_argument(
+        "--save-baseline", help="store this run as baseline", action="store_true"
+    )
+    parser.add_argument(
+        "--threshold", help="regression wall time ratio", type=float, default=1.2
+    )
+    args = parser.parse_args()
+    return {
+        "dataset": args.dataset,
+        "engine": args.engine or list(ENGINE),
+        "repeat": args.repeat,
+        "history": args.history,
+        "baseline": args.baseline,
+        "save_baseline": args.save_baseline,
+        "threshold": args.threshold,
+    }
+
+
+def get_version():
+    """get_version: return installed parenx version and git commit"""
+    try:
+        r = version("parenx")
+    except PackageNotFoundError:
+        r = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=BENCHMARK,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return r, commit
+
+
+def run_engine(engine, this_gf, repeat=1):
+    """run_engine: return best wall time per stage over repeat runs
+
+    args:
+      engine: ENGINE key
+      this_gf: input GeoDataFrame
+      repeat: timing repeats (default value = 1)
+
+    returns:
+      total wall, per stage wall dict, output geometry count
+    """
+    fn, parameter = ENGINE[engine]
+    wall, stage, count = None, {}, 0
+    for _ in range(repeat):
+        with Report(trace=False) as report:
+            total = time.perf_counter()
+            r = fn(this_gf, parameter)
+            total = time.perf_counter() - total
+        v = report.get_summary()
+        if wall is None or total < wall:
+            wall, count = total, len(r)
+            stage = {k: s["wall"] for k, s in v.items()}
+    return wall, stage, count
+
+
+def compare(record, baseline, threshold):
+    """compare: print wall time ratio against baseline and return regression count
+
+    args:
+      record: benchmark record list
+      baseline: baseline record dict keyed on engine and dataset
+      threshold: regression wall time ratio
+
+    returns:
+      number of regressions
+    """
+    r = 0
+    for v in record:
+        key = f"{v['engine']}:{v['dataset']}"
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key}\t{v['wall']:.3f}s\tno baseline")
+            continue
+        ratio = v["wall"] / base["wall"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{key}\t{v['wall']:.3f}s\t{base['wall']:.3f}s\t{ratio:.2f}\t{flag}")
+        for k, wall in v["stage"].items():
+            base_wall = base["stage"].get(k)
+            if base_wall:
+                print(f"  {k}\t{wall:.3f}s\t{base_wall:.3f}s\t{wall / base_wall:.2f}")
+        r += ratio > threshold
+    return r
+
+
+def main():
+    """main: benchmark engines on datasets, append history and compare to baseline"""
+    parameter = get_args()
+    release, commit = get_version()
+    created = dt.datetime.now().isoformat()
+    record = []
+    for filepath in parameter["dataset"]:
+        base_nx = get_base_geojson(filepath)
+        dataset = os.path.basename(filepath)
+        for engine in parameter["engine"]:
+            wall, stage, count = run_engine(engine, base_nx, parameter["repeat"])
+            print(f"{engine}\t{dataset}\t{wall:.3f}s")
+            record.append(
+                {
+                    "created": created,
+                    "version": release,
+                    "commit": commit,
+                    "engine": engine,
+                    "dataset": dataset,
+                    "input": len(base_nx),
+                    "output": count,
+                    "repeat": parameter["repeat"],
+                    "wall": wall,
+                    "stage": stage,
+                }
+            )
+    with open(parameter["history"], "a", encoding="utf-8") as fout:
+        for v in record:
+            fout.write(json.dumps(v) + "\n")
+    baseline = {}
+    if os.path.exists(parameter["baseline"]):
+        with open(parameter["baseline"], encoding="utf-8") as fin:
+            baseline = json.load(fin)
+    regression = compare(record, baseline, parameter["threshold"])
+    if parameter["save_baseline"]:
+        baseline.update({f"{v['engine']}:{v['dataset']}": v for v in record})
+        with open(parameter["baseline"], "w", encoding="utf-8") as fout:
+            json.dump(baseline, fout, indent=2)
+    sys.exit(1 if regression else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""parenx: simplify GeoJSON networks using image skeletonization and Voronoi polygons"""
+
+
+def __getattr__(name):
+    """__getattr__: import the simplify API on first use"""
+    if name == "simplify":
+        from .api import simplify
+
+        return simplify
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
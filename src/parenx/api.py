@@ -0,0 +1,116 @@
+"""api.py: in-memory GeoDataFrame network simplification"""
+
+import geopandas as gp
+
+from .cache import CACHE_SIZE
+from .shared import get_base_frame, get_primal
+from .skeletonize import skeletonize_frame, skeletonize_sweep, skeletonize_tolerance
+from .tile_skeletonize import skeletonize_tiles
+from .voronoi import voronoi_frame
+
+SKELETON = {
+    "tolerance": 0.0,
+    "buffer": 8.0,
+    "scale": 1.0,
+    "knot": False,
+    "segment": False,
+    "workers": 1,
+    "distance": False,
+    "cache": None,
+    "cache_size": CACHE_SIZE,
+}
+
+PARAMETER = {
+    "skeleton": {**SKELETON, "sweep": None},
+    "tiled": {
+        **SKELETON,
+        "side_length": 2000.0,
+        "budget": None,
+        "checkpoint": None,
+    },
+    "voronoi": {
+        "simplify": 0.0,
+        "buffer": 8.0,
+        "scale": 5.0,
+        "tolerance": 1.0,
+        "workers": 1,
+        "cache": None,
+        "cache_size": CACHE_SIZE,
+    },
+}
+
+
+def get_parameter(method, **parameter):
+    """get_parameter: return method default parameter dict updated with parameter
+
+    args:
+      method: "skeleton", "tiled" or "voronoi"
+      parameter: parameter values to override
+
+    returns:
+      parameter dict
+    """
+    try:
+        r = PARAMETER[method].copy()
+    except KeyError as e:
+        message = f"unknown method {method!r}, use one of {list(PARAMETER)}"
+        raise ValueError(message) from e
+    unknown = set(parameter) - set(r)
+    if unknown:
+        raise ValueError(f"unknown {method} parameter {sorted(unknown)}")
+    r.update(parameter)
+    if method != "skeleton" and isinstance(r["tolerance"], (list, tuple)):
+        raise ValueError(f"{method} does not support a tolerance list")
+    return r
+
+
+def simplify(this_nx, method="skeleton", primal=False, **parameter):
+    """simplify: return simplified network from LineString GeoDataFrame or GeoSeries
+
+    args:
+      this_nx: LineString GeoDataFrame or GeoSeries with CRS
+      method: "skeleton", "tiled" or "voronoi" (default value = "skeleton")
+      primal: also return primal edge and node GeoDataFrames (default value = False)
+      parameter: method parameters, as the matching command line:
+        skeleton: tolerance, buffer, scale, knot, segment, workers, distance, sweep,
+                  cache, cache_size
+        tiled:    tolerance, buffer, scale, knot, segment, workers, distance,
+                  cache, cache_size, side_length, budget, checkpoint
+        voronoi:  simplify, buffer, scale, tolerance, workers, cache, cache_size
+
+    returns:
+      simplified LineString GeoDataFrame in EPSG:27700, or line, edge, node
+      GeoDataFrames if primal, or a dict of these keyed on radius if sweep, on
+      tolerance if a skeleton tolerance list, or on radius and tolerance tuple if both
+    """
+    parameter = get_parameter(method, **parameter)
+    base_nx = get_base_frame(this_nx).geometry
+    if method == "skeleton" and isinstance(parameter["tolerance"], (list, tuple)):
+        r = skeletonize_tolerance(base_nx, parameter)
+        return {k: get_result(v, primal) for k, v in r.items()}
+    if method == "skeleton" and parameter["sweep"]:
+        r = skeletonize_sweep(base_nx, parameter)
+        return {k: get_result(v, primal) for k, v in r.items()}
+    if method == "skeleton":
+        r = skeletonize_frame(base_nx, parameter)
+    elif method == "tiled":
+        r = skeletonize_tiles(base_nx, parameter)
+    else:
+        r = voronoi_frame(base_nx, parameter)
+    return get_result(r, primal)
+
+
+def get_result(line, primal=False):
+    """get_result: return line GeoDataFrame, and primal edge and node if primal
+
+    args:
+      line: simplified LineString GeoDataFrame
+      primal: also return primal edge and node GeoDataFrames (default value = False)
+
+    returns:
+      line GeoDataFrame, or line, edge, node GeoDataFrames
+    """
+    r = gp.GeoDataFrame(line.reset_index(drop=True), geometry="geometry")
+    if primal:
+        return (r, *get_primal(r["geometry"]))
+    return r
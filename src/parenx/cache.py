@@ -0,0 +1,142 @@
+"""cache.py: content-addressed on-disk stage cache with least recently used eviction"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+from shapely import to_wkb
+
+CACHE_SIZE = 1024.0
+SUFFIX = ".pkl"
+
+
+def get_digest(*value):
+    """get_digest: return SHA-256 hex digest of geometry, array and parameter values
+
+    args:
+      value: GeoDataFrame, GeoSeries, numpy array or JSON serializable values
+
+    returns:
+      hex digest str
+    """
+    r = hashlib.sha256()
+    for v in value:
+        if hasattr(v, "crs") and hasattr(v, "geometry"):
+            r.update(str(v.crs).encode())
+            wkb = to_wkb(np.asarray(v.geometry))
+            r.update(b"".join(i or b"" for i in wkb))
+        elif isinstance(v, np.ndarray):
+            r.update(f"{v.dtype.str}{v.shape}".encode())
+            r.update(np.ascontiguousarray(v).tobytes())
+        else:
+            r.update(json.dumps(v, sort_keys=True, default=str).encode())
+        r.update(b"\0")
+    return r.hexdigest()
+
+
+def get_key(parameter, *value):
+    """get_key: return cache key from values if parameter sets a cache directory
+
+    args:
+      parameter: parameter dict with optional "cache" directory
+      value: values the cached stage depends on
+
+    returns:
+      hex digest str or None
+    """
+    if not parameter.get("cache"):
+        return None
+    return get_digest(*value)
+
+
+def evict(path, size):
+    """evict: remove least recently used cache entries until under size
+
+    args:
+      path: cache directory
+      size: cache size limit [bytes]
+
+    returns:
+      None
+    """
+    r = []
+    for entry in os.scandir(path):
+        if entry.name.endswith(SUFFIX):
+            try:
+                v = entry.stat()
+            except FileNotFoundError:
+                continue
+            r.append((v.st_mtime, v.st_size, entry.path))
+    total = sum(v[1] for v in r)
+    for _, v, filepath in sorted(r):
+        if total <= size:
+            break
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+        total -= v
+
+
+def load(filepath):
+    """load: return cache entry value and mark it as recently used
+
+    args:
+      filepath: cache entry path
+
+    returns:
+      cached value
+    """
+    with open(filepath, "rb") as fin:
+        r = pickle.load(fin)
+    os.utime(filepath)
+    return r
+
+
+def store(filepath, value):
+    """store: atomically write cache entry value
+
+    args:
+      filepath: cache entry path
+      value: value to cache
+
+    returns:
+      None
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(filepath), suffix=".tmp", delete=False
+    ) as fout:
+        pickle.dump(value, fout, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fout.name, filepath)
+
+
+def cached(name, parameter, key, fn, *args):
+    """cached: return fn(*args), read from or written to the parameter cache directory
+    under stage name and key
+
+    args:
+      name: stage name
+      parameter: parameter dict with optional "cache" directory and "cache_size" [MB]
+      key: cache key from get_key
+      fn: stage function
+      args: stage function arguments
+
+    returns:
+      stage function value
+    """
+    path = parameter.get("cache")
+    if not path or key is None:
+        return fn(*args)
+    filepath = os.path.join(path, f"{name}-{key}{SUFFIX}")
+    try:
+        return load(filepath)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    r = fn(*args)
+    os.makedirs(path, exist_ok=True)
+    store(filepath, r)
+    evict(path, parameter.get("cache_size", CACHE_SIZE) * 2**20)
+    return r
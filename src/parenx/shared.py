@@ -1,16 +1,29 @@
 """share.py: common skeletonize and voronoi functions"""
 
-import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from importlib.util import find_spec
 
 import geopandas as gp
 import numpy as np
-from pyogrio import read_dataframe
-from shapely import get_coordinates, line_merge, set_precision, unary_union
-from shapely.geometry import LineString, MultiLineString, Point
+from pyogrio import read_dataframe, read_info, write_dataframe
+from pyproj import CRS as PROJ_CRS
+from shapely import (
+    box,
+    buffer,
+    get_coordinates,
+    get_num_coordinates,
+    get_parts,
+    line_merge,
+    linestrings,
+    set_precision,
+    unary_union,
+)
+from shapely.geometry import MultiLineString
 
-START = dt.datetime.now()
 CRS = "EPSG:27700"
+CRS_27700 = PROJ_CRS(CRS)
+USE_ARROW = find_spec("pyarrow") is not None
 
 set_precision_pointone = partial(set_precision, grid_size=0.1)
 
@@ -31,18 +44,68 @@ def combine_line(line):
     except AttributeError:
         return gp.GeoSeries(line_merge(r), crs=CRS)
 
-def get_base_geojson(filepath):
+
+def get_source_filter(filepath, bbox=None, mask=None):
+    """get_source_filter: return EPSG:27700 bbox and mask filter in the source CRS
+
+    args:
+      filepath: GeoJSON path
+      bbox: (xmin, ymin, xmax, ymax) EPSG:27700 or None
+      mask: Polygon EPSG:27700 or None
+
+    returns:
+      bbox, mask in source CRS
+
+    """
+    crs = read_info(filepath)["crs"]
+    if not crs or CRS_27700.equals(crs):
+        return bbox, mask
+    if bbox is not None:
+        bbox = tuple(gp.GeoSeries(box(*bbox), crs=CRS).to_crs(crs).total_bounds)
+    if mask is not None:
+        mask = gp.GeoSeries(mask, crs=CRS).to_crs(crs).iloc[0]
+    return bbox, mask
+
+
+def get_base_geojson(filepath, bbox=None, mask=None):
     """get_base_nx: return GeoDataFrame at 0.1m precision from GeoJSON
 
     args:
       filepath: GeoJSON path
+      bbox: optional (xmin, ymin, xmax, ymax) EPSG:27700 features filter
+      mask: optional Polygon EPSG:27700 features filter
 
     returns:
       GeoDataFrame at 0.1m precision
 
     """
-    r = read_dataframe(filepath).to_crs(CRS)
-    r["geometry"] = r["geometry"].map(set_precision_pointone)
+    if bbox is not None or mask is not None:
+        bbox, mask = get_source_filter(filepath, bbox, mask)
+    r = read_dataframe(filepath, bbox=bbox, mask=mask, use_arrow=USE_ARROW)
+    return get_base_frame(r, copy=False)
+
+
+def get_base_frame(this_gf, copy=True):
+    """get_base_frame: return GeoDataFrame or GeoSeries in EPSG:27700 at 0.1m precision
+
+    args:
+      this_gf: GeoDataFrame or GeoSeries
+      copy: copy rather than update this_gf in EPSG:27700 (default value = True)
+
+    returns:
+      GeoDataFrame or GeoSeries at 0.1m precision
+
+    """
+    r = this_gf
+    if not CRS_27700.equals(r.crs):
+        r = r.to_crs(CRS)
+    elif copy:
+        r = r.copy()
+    geometry = set_precision_pointone(r.geometry.values)
+    geometry = gp.GeoSeries(geometry, index=r.index, crs=CRS, name=r.geometry.name)
+    if isinstance(r, gp.GeoSeries):
+        return geometry
+    r[r.geometry.name] = geometry
     return r
 
 
@@ -60,46 +123,138 @@ def get_end(geometry):
     return np.vstack((r[0, :], r[-1, :]))
 
 
-def get_geometry_buffer(this_gf, radius=8.0):
+def get_ends(geometry):
+    """get_ends: return numpy array of LineString end-points from geometry array, raising
+    ValueError on empty or missing geometry
+
+    args:
+      geometry: LineString GeoSeries or geometry array
+
+    returns:
+      (n, 2, 2) end-point numpy array
+
+    """
+    geometry = np.asarray(geometry)
+    r = get_coordinates(geometry)
+    count = get_num_coordinates(geometry)
+    if np.any(count == 0):
+        raise ValueError("empty geometry has no end-points")
+    end = np.cumsum(count) - 1
+    start = end - count + 1
+    return np.stack((r[start], r[end]), axis=1)
+
+
+def get_tree_union(geometry, workers=1):
+    """get_tree_union: return union of geometry, split into workers partitions along a
+    Hilbert curve, unioned in a thread pool and merged pairwise
+
+    args:
+      geometry: geometry numpy array
+      workers: thread pool size (default value = 1)
+
+    returns:
+      union geometry
+    """
+    if workers < 2 or len(geometry) < 2 * workers:
+        return unary_union(geometry)
+    order = np.argsort(gp.GeoSeries(geometry).hilbert_distance().values, kind="stable")
+    r = np.array_split(geometry[order], workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        r = list(executor.map(unary_union, r))
+        while len(r) > 1:
+            pair = [r[i : i + 2] for i in range(0, len(r), 2)]
+            r = list(executor.map(unary_union, pair))
+    return r[0]
+
+
+def get_geometry_buffer(this_gf, radius=8.0, workers=1):
     """get_geometry_buffer: return radius buffered GeoDataFrame
 
     args:
       this_gf: GeoDataFrame to
       radius: (default value = 8.0)
+      workers: union and buffer thread pool size (default value = 1)
 
     returns:
       buffered GeoSeries geometry
 
     """
-    try:
-        r = gp.GeoSeries(unary_union(this_gf).geoms, crs=CRS)
-    except AttributeError:
-        r = gp.GeoSeries(this_gf, crs=CRS)
-    r = gp.GeoSeries(r, crs=CRS).buffer(radius, join_style="mitre")
-    union = unary_union(r)
-    try:
-        r = gp.GeoSeries(union.geoms, crs=CRS)
-    except AttributeError:
-        r = gp.GeoSeries(union, crs=CRS)
-    return r
+    r = get_parts(get_tree_union(np.asarray(this_gf), workers))
+    fn = partial(buffer, distance=radius, quad_segs=16, join_style="mitre")
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            r = np.concatenate(list(executor.map(fn, np.array_split(r, workers))))
+    else:
+        r = fn(r)
+    union = get_tree_union(r, workers)
+    return gp.GeoSeries(get_parts(union), crs=CRS)
 
 
-def get_nx(line):
-    """get_nx: return primal edge network from LineString GeoDataFrame
+def get_primal(line):
+    """get_primal: return primal edge and node GeoDataFrames from LineString GeoSeries
+    with edge source and target, and node degree
 
     args:
-      line: LineString GeoDataFrame
+      line: LineString GeoSeries
+
+    returns:
+      edge, node: GeoDataFrames
+
+    """
+    r = get_ends(line)
+    edge = gp.GeoSeries(linestrings(r), crs=CRS).to_frame("geometry")
+    node, source, target = get_node(r)
+    node = node.rename(columns={"count": "degree"})
+    edge = edge.reset_index(names="edge")
+    edge["source"] = source
+    edge["target"] = target
+    return edge, node
+
+
+def get_node_index(point, grid_size=0.1):
+    """get_node_index: return unique node index, inverse and count from point coordinates
+    quantised to integer keys on a grid_size grid
+
+    args:
+      point: (n, 2) coordinate numpy array
+      grid_size: quantisation grid [m] (default value = 0.1)
 
     returns:
-      edge GeoDataFrames
+      first point index, point node id and node count int numpy arrays
 
     """
-    r = line.map(get_end)
-    edge = gp.GeoSeries(r.map(LineString), crs=CRS)
-    r = np.vstack(r.to_numpy())
-    r = gp.GeoSeries(map(Point, r)).to_frame("geometry")
-    r = r.groupby(r.columns.to_list(), as_index=False).size()
-    return edge
+    if len(point) == 0:
+        r = np.zeros(0, dtype=np.int64)
+        return r, r, r
+    r = np.rint(point / grid_size).astype(np.int64)
+    r = r - r.min(axis=0)
+    key = r[:, 0] * (r[:, 1].max() + 1) + r[:, 1]
+    _, ix, inverse, count = np.unique(
+        key, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.argsort(ix, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return ix[order], rank[inverse.reshape(-1)], count[order]
+
+
+def get_node(end):
+    """get_node: return unique node GeoDataFrame and edge source and target from
+    end-points
+
+    args:
+      end: (n, 2, 2) end-point numpy array
+
+    returns:
+      node GeoDataFrame, source and target int numpy arrays
+
+    """
+    r = end.reshape(-1, 2)
+    ix, inverse, count = get_node_index(r)
+    node = gp.GeoSeries(gp.points_from_xy(*r[ix].T), crs=CRS).to_frame("geometry")
+    node["count"] = count
+    node = node.reset_index(names="node")
+    return node, inverse[0::2], inverse[1::2]
 
 
 def get_source_target(line):
@@ -114,27 +269,51 @@ def get_source_target(line):
 
     """
     edge = line.copy()
-    r = edge["geometry"].map(get_end)
-    r = np.stack(r)
-    node = gp.GeoSeries(map(Point, r.reshape(-1, 2)), crs=CRS).to_frame("geometry")
-    count = node.groupby("geometry").size().rename("count")
-    node = node.drop_duplicates("geometry").set_index("geometry", drop=False)
-    node = node.join(count).reset_index(drop=True).reset_index(names="node")
-    ix = node.set_index("geometry")["node"]
+    node, source, target = get_node(get_ends(edge["geometry"]))
     edge = edge.reset_index(names="edge")
-    edge["source"] = ix.loc[map(Point, r[:, 0])].values
-    edge["target"] = ix.loc[map(Point, r[:, 1])].values
+    edge["source"] = source
+    edge["target"] = target
     return edge, node
 
 
-def log(this_string):
-    """log: print timestamp appended to 'this_string'
+def get_output_layer(this_nx, line, parameter):
+    """get_output_layer: return named output layers with optional input echo and
+    primal network
+
+    args:
+      this_nx: input GeoDataFrame
+      line: simplified LineString GeoDataFrame, or layer suffix GeoDataFrame dict
+      parameter: parameter dict with "input" and "primal" flags
+
+    returns:
+      layer name GeoDataFrame dict
+
+    """
+    r = {}
+    if parameter.get("input", True):
+        r["input"] = this_nx
+    if not isinstance(line, dict):
+        line = {"": line}
+    for k, v in line.items():
+        r[f"line{k}"] = v
+        if parameter.get("primal", True):
+            r[f"primal{k}"], r[f"node{k}"] = get_primal(v["geometry"])
+    return r
+
 
-      this_string: text to print
+def write_layer(layer, outpath, spatial_index=True):
+    """write_layer: write named GeoDataFrame layers to GeoPKG, streamed through Arrow
+    where available, with spatial index built once each layer is complete
+
+    args:
+      layer: layer name GeoDataFrame dict
+      outpath: GeoPKG output path
+      spatial_index: create layer spatial index (default value = True)
 
     returns:
       None
 
     """
-    now = dt.datetime.now() - START
-    print(f"{this_string }\t{now}")
+    option = {"SPATIAL_INDEX": "YES" if spatial_index else "NO"}
+    for k, v in layer.items():
+        write_dataframe(v, outpath, layer=k, use_arrow=USE_ARROW, layer_options=option)
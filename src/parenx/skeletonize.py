@@ -3,36 +3,42 @@
 
 import argparse
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
 import geopandas as gp
-import networkx as nx
 import numpy as np
 import pandas as pd
-import rasterio as rio
-import rasterio.features as rif
-from pyogrio import write_dataframe
-from shapely import line_interpolate_point, set_precision, snap
+from shapely import (
+    STRtree,
+    get_coordinates,
+    length as get_length,
+    line_interpolate_point,
+    linestrings,
+    set_precision,
+    snap,
+    union_all,
+)
 from shapely.affinity import affine_transform
-from shapely.geometry import LineString, MultiPoint, Point
+from shapely.geometry import LineString
 from shapely.ops import split
-from skimage.morphology import remove_small_holes, skeletonize
 
+from .cache import CACHE_SIZE, cached, get_key
 from .shared import (
     combine_line,
     CRS,
     get_base_geojson,
     get_geometry_buffer,
-    get_nx,
+    get_output_layer,
     get_source_target,
-    log,
+    write_layer,
 )
+from .stage import Report, stage
 
 TRANSFORM_ONE = np.asarray([0.0, 1.0, -1.0, 0.0, 1.0, 1.0])
+NEIGHBOUR = np.asarray([[0, 1], [1, -1], [1, 0], [1, 1]])
 EMPTY = LineString([])
 
-pd.set_option("display.max_columns", None)
-
 
 def get_args():
     """get_args: get command line parameters
@@ -50,20 +56,62 @@ def get_args():
         help="GeoGPKG output path",
         default="output.gpkg",
     )
-    parser.add_argument("--simplify", help="tolerance [m]", type=float, default=0.0)
+    parser.add_argument(
+        "--simplify", help="tolerances [m]", type=float, nargs="+", default=[0.0]
+    )
     parser.add_argument("--buffer", help="line buffer [m]", type=float, default=8.0)
     parser.add_argument("--scale", help="raster scale", type=float, default=1.0)
     parser.add_argument("--knot", help="keep image knots", action="store_true")
     parser.add_argument("--segment", help="segment", action="store_true")
+    parser.add_argument(
+        "--workers",
+        help="buffer thread and component process pool size",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--distance", help="distance transform in place of buffer", action="store_true"
+    )
+    parser.add_argument(
+        "--sweep", help="distance transform buffer radii [m]", type=float, nargs="+"
+    )
+    parser.add_argument(
+        "--no-primal", help="skip primal network output", action="store_true"
+    )
+    parser.add_argument(
+        "--no-input", help="skip input network output", action="store_true"
+    )
+    parser.add_argument(
+        "--bbox",
+        help="EPSG:27700 input filter [m]",
+        type=float,
+        nargs=4,
+        metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+        default=None,
+    )
+    parser.add_argument("--report", help="JSON stage report path", type=str)
+    parser.add_argument("--cache", help="stage cache directory", type=str)
+    parser.add_argument(
+        "--cache-size", help="stage cache size [MB]", type=float, default=CACHE_SIZE
+    )
     args = parser.parse_args()
     return {
         "inpath": args.inpath,
         "outpath": args.outpath,
-        "tolerance": args.simplify,
+        "tolerance": args.simplify[0] if len(args.simplify) == 1 else args.simplify,
         "buffer": args.buffer,
         "scale": args.scale,
         "knot": args.knot,
         "segment": args.segment,
+        "workers": args.workers,
+        "distance": args.distance,
+        "sweep": args.sweep,
+        "primal": not args.no_primal,
+        "input": not args.no_input,
+        "bbox": args.bbox,
+        "report": args.report,
+        "cache": args.cache,
+        "cache_size": args.cache_size,
     }
 
 
@@ -82,37 +130,167 @@ def get_pxsize(bound, scale=1.0):
     return (r[[1, 0]] * scale).astype(int)
 
 
-def get_affine_transform(this_gf, scale=1.0):
+def get_affine_transform(this_gf, scale=1.0, origin=None, offset=0.0):
     """get_affine_transform: return affine transformations matrices, and scaled image size
     from GeoPandas boundary size
 
       this_gf: GeoPanda
       scale:  (default = 1.0)
+      origin: optional top-left corner of a pixel grid to align a 1px padded
+        window to (default = None)
+      offset: distance to extend boundary [m] (default = 0.0)
 
     returns:
       rasterio and shapely affine tranformation matrices, and image size in px
 
     """
-    bound = this_gf.total_bounds
+    from rasterio import Affine
+
+    bound = this_gf.total_bounds + np.asarray([-1.0, -1.0, 1.0, 1.0]) * offset
     s = TRANSFORM_ONE / scale
-    s[[4, 5]] = bound[[0, 3]]
+    if origin is None:
+        s[[4, 5]] = bound[[0, 3]]
+        shape = get_pxsize(bound, scale)
+    else:
+        offset = np.floor((bound[[0, 3]] - origin) * [scale, -scale]) - 1.0
+        s[[4, 5]] = origin + offset / [scale, -scale]
+        extent = (bound[[2, 1]] - s[[4, 5]]) * [scale, -scale]
+        shape = (np.ceil(extent) + 1.0)[[1, 0]].astype(int)
     r = s[[1, 0, 4, 3, 2, 5]]
-    r = rio.Affine(*r)
-    return r, s, get_pxsize(bound, scale)
+    r = Affine(*r)
+    return r, s, shape
 
 
-def get_raster_point(raster, value=1):
-    """get_raster_point: return Point GeoSeries from raster array with values >= value
+def get_window(s_matrix, bound, scale, shape):
+    """get_window: return row and column slices of a raster window that lie inside the
+    pixel grid of the network boundary
 
     args:
-      raster: raster numpy array
-      value: point threshold (default value = 1)
+      s_matrix: shapely affine transformation matrix of the window
+      bound: network boundary corner points
+      scale: raster scale
+      shape: window px size
+
+    returns:
+      row and column slice tuple
+
+    """
+    offset = np.rint((s_matrix[[5, 4]] - bound[[3, 0]]) * [-scale, scale]).astype(int)
+    start = np.clip(-offset, 0, shape)
+    end = np.clip(get_pxsize(bound, scale) - offset, 0, shape)
+    return tuple(slice(i, j) for i, j in zip(start, end))
+
+
+def get_component(geometry, distance=None):
+    """get_component: return connected component label of geometry within distance, or
+    with intersecting envelopes if distance is None
+
+    args:
+      geometry: Polygon GeoSeries
+      distance: separation distance (default value = None)
+
+    returns:
+      component label numpy array
+
+    """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(geometry)
+    tree = STRtree(geometry.values)
+    if distance is None:
+        i, j = tree.query(geometry.values)
+    else:
+        i, j = tree.query(geometry.values, predicate="dwithin", distance=distance)
+    graph = coo_matrix((np.ones(len(i)), (i, j)), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+
+def get_raster_edge(raster):
+    """get_raster_edge: return pixel coordinates and 8-neighbour adjacent pixel pairs
+    from raster array using array shifts
+
+    args:
+      raster: 1px line raster array
+
+    returns:
+      (n, 2) pixel coordinate, and source and target pixel index numpy arrays
+
+    """
+    point = np.argwhere(raster > 0)
+    index = np.full(raster.shape, -1, dtype=np.int64)
+    index[point[:, 0], point[:, 1]] = np.arange(len(point))
+    source, target = [], []
+    for offset in NEIGHBOUR:
+        r = point + offset
+        ix = np.all((r >= 0) & (r < raster.shape), axis=1)
+        k = index[r[ix, 0], r[ix, 1]]
+        source.append(np.flatnonzero(ix)[k >= 0])
+        target.append(k[k >= 0])
+    return point, np.concatenate(source), np.concatenate(target)
+
+
+def get_chain(source, target, n):
+    """get_chain: return ordered pixel index and chain id of maximal pixel chains
+    between end-point and junction pixels, classified by neighbour count
+
+    args:
+      source: edge source pixel index numpy array
+      target: edge target pixel index numpy array
+      n: pixel count
+
     returns:
-      GeoSeries Point
+      ordered pixel index and chain id numpy arrays, with closed chains repeating
+      their first pixel
 
     """
-    r = np.stack(np.where(raster >= value))
-    return gp.GeoSeries(map(Point, r.T), crs=CRS)
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import breadth_first_order, connected_components
+
+    m = len(source)
+    edge_id = np.arange(m)
+    degree = np.bincount(np.concatenate([source, target]), minlength=n)
+    inner = degree == 2
+    # link the two edges at each chain pixel to label chains
+    pixel = np.concatenate([source, target])
+    edge = np.concatenate([edge_id, edge_id])
+    ix = inner[pixel]
+    pixel, edge = pixel[ix], edge[ix]
+    ix = np.argsort(pixel, kind="stable")
+    edge = edge[ix].reshape(-1, 2)
+    link = coo_matrix((np.ones(len(edge)), (edge[:, 0], edge[:, 1])), shape=(m, m))
+    n_chain, chain = connected_components(link, directed=False)
+    # chain pixels keep their index, end-point and junction ends are split per edge
+    u = np.where(inner[source], source, n + 2 * edge_id)
+    v = np.where(inner[target], target, n + 2 * edge_id + 1)
+    pixel_of = np.concatenate([np.arange(n), np.stack([source, target], 1).reshape(-1)])
+    chain_of = np.full(n + 2 * m, -1)
+    chain_of[u] = chain
+    chain_of[v] = chain
+    # start chains at an end, or at the first edge of closed chains with it removed
+    first = np.full(n_chain, m)
+    np.minimum.at(first, chain, edge_id)
+    closed = np.ones(n_chain, dtype=bool)
+    closed[chain[~inner[source] | ~inner[target]]] = False
+    start = np.full(n_chain, n + 2 * m)
+    end = np.where(inner[source], n + 2 * m, u)
+    np.minimum.at(start, chain, end)
+    end = np.where(inner[target], n + 2 * m, v)
+    np.minimum.at(start, chain, end)
+    start[closed] = u[first[closed]]
+    keep = np.ones(m, dtype=bool)
+    keep[first[closed]] = False
+    root = n + 2 * m
+    i = np.concatenate([u[keep], np.full(n_chain, root)])
+    j = np.concatenate([v[keep], start])
+    graph = coo_matrix((np.ones(len(i)), (i, j)), shape=(root + 1, root + 1)).tocsr()
+    order = breadth_first_order(graph, root, directed=False, return_predecessors=False)
+    order = order[1:]
+    ring = np.flatnonzero(closed)
+    order = np.concatenate([order, start[ring]])
+    chain_id = np.concatenate([chain_of[order[: len(order) - len(ring)]], ring])
+    ix = np.argsort(chain_id, kind="stable")
+    return pixel_of[order[ix]], chain_id[ix]
 
 
 def sx_to_nx(this_gf, transform, simplify=0.0):
@@ -138,40 +316,117 @@ def sx_to_nx(this_gf, transform, simplify=0.0):
     return r
 
 
-def get_skeleton(geometry, transform, shape, scale):
-    """get_skeleton: return skeletonized raster buffer from Shapely geometry
+def get_distance_mask(raster, distance, block=128):
+    """get_distance_mask: return mask of pixels within distance of a raster value, from
+    Euclidean distance transforms of overlapping blocks, skipping empty blocks
 
     args:
-      geometry: Shapely geometry to convert to raster buffer
-      transform: rasterio affine transformation
-      shape: output buffer px size
+      raster: raster numpy array
+      distance: threshold distance, or sequence of distances [px]
+      block: block size [px] (default value = 128)
 
     returns:
-      skeltonized numpy array raster buffer
+      boolean numpy array mask, stacked by distance if a sequence
 
     """
-    r = rif.rasterize(geometry.values, transform=transform, out_shape=shape)
+    from scipy.ndimage import distance_transform_edt
+
+    n, m = raster.shape
+    threshold = np.atleast_1d(distance)
+    halo = int(np.ceil(threshold.max())) + 1
+    r = np.zeros((len(threshold), n, m), dtype=bool)
+    for i in range(0, n, block):
+        i_start, i_end = max(i - halo, 0), min(i + block + halo, n)
+        for j in range(0, m, block):
+            j_start, j_end = max(j - halo, 0), min(j + block + halo, m)
+            v = raster[i_start:i_end, j_start:j_end] == 0
+            if v.all():
+                continue
+            v = distance_transform_edt(v)
+            k, l = min(i + block, n), min(j + block, m)
+            v = v[i - i_start : k - i_start, j - j_start : l - j_start]
+            r[:, i:k, j:l] = v <= threshold[:, np.newaxis, np.newaxis]
+    if np.ndim(distance) == 0:
+        return r[0]
+    return r
+
+
+def fill_small_hole(raster, scale, window=None):
+    """fill_small_hole: return uint8 raster with holes smaller than 16px² at scale filled
+
+    args:
+      raster: raster numpy array
+      scale: raster scale
+      window: optional row and column slices of the network pixel grid, pixels
+        outside are cleared so holes open to the grid edge stay bounded by it
+        (default value = None)
+
+    returns:
+      numpy array raster
+
+    """
+    from skimage.morphology import remove_small_holes
+
+    if window is not None:
+        r = np.zeros(raster.shape, dtype=np.uint8)
+        r[window] = fill_small_hole(raster[window], scale)
+        return r
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
         # parent, traverse = max_tree(invert(r))
-        r = remove_small_holes(r, 16 * scale).astype(np.uint8)
-    return skeletonize(r).astype(np.uint8)
+        return remove_small_holes(raster, 16 * scale).astype(np.uint8)
+
+
+def get_raster(geometry, transform, shape, scale, radius=None, window=None):
+    """get_raster: return raster buffer from Shapely geometry with small holes removed
+
+    args:
+      geometry: Shapely geometry to convert to raster buffer
+      transform: rasterio affine transformation
+      shape: output buffer px size
+      radius: if set, burn LineString geometry and threshold its Euclidean distance
+        transform at radius [m] in place of a Polygon buffer (default value = None)
+      window: network pixel grid slices passed to fill_small_hole (default = None)
+
+    returns:
+      numpy array raster buffer
+
+    """
+    from rasterio.features import rasterize
+
+    if radius is None:
+        r = rasterize(geometry.values, transform=transform, out_shape=shape)
+    else:
+        r = rasterize(
+            geometry.values, transform=transform, out_shape=shape, all_touched=True
+        )
+        r = get_distance_mask(r, radius * scale)
+    return fill_small_hole(r, scale, window)
 
 
-def get_connected_class(edge_list):
-    """get_connected_class: return labeled connected node pandas Series from edge list
+def get_connected_class(source, target, n):
+    """get_connected_class: return connected component label for each node from edge list
 
     args:
-      edge_list: source, target edge pandas DataFrame
+      source: edge source node numpy array
+      target: edge target node numpy array
+      n: node count
 
     returns:
-      labeled node pandas Series
+      node class numpy array, -1 for nodes not in the edge list
 
     """
-    nx_graph = nx.from_pandas_edgelist(edge_list)
-    connected = nx.connected_components(nx_graph)
-    r = {k: i for i, j in enumerate(connected) for k in j}
-    return pd.Series(r, name="class")
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(source)), (source, target)), shape=(n, n))
+    _, r = connected_components(graph, directed=False)
+    ix = np.zeros(n, dtype=bool)
+    ix[source] = True
+    ix[target] = True
+    _, r[ix] = np.unique(r[ix], return_inverse=True)
+    r[~ix] = -1
+    return r
 
 
 def get_centre_edge(node):
@@ -184,43 +439,41 @@ def get_centre_edge(node):
       GeoDataCentre node cluster centroid Point
 
     """
-    centre = node[["geometry", "class"]].groupby("class").aggregate(tuple)
-    centre = gp.GeoSeries(centre["geometry"].map(MultiPoint), crs=CRS).centroid
-    centre = centre.rename("target")
-    geometry = node[["class", "geometry"]].set_index("class").join(centre)
-    geometry = geometry.apply(LineString, axis=1)
+    point = get_coordinates(node["geometry"].values)
+    _, ix, count = np.unique(
+        node["class"].values, return_inverse=True, return_counts=True
+    )
+    centre = np.stack([np.bincount(ix, weights=v) for v in point.T], axis=1)
+    centre = centre / count[:, np.newaxis]
     r = node.rename(columns={"node": "source"}).copy()
-    r["geometry"] = geometry.values
+    r["geometry"] = linestrings(np.stack([point, centre[ix]], axis=1))
     return r
 
 
-def get_raster_line(point, knot=False):
+def get_raster_line(raster, knot=False):
     """get_raster_line: return LineString GeoSeries from 1px line raster eliminating knots
 
     args:
-      point: 1px raster array with knots
+      raster: 1px line raster array with knots
 
     returns:
       1px line LineString GeoSeries with knots removed
 
     """
-    square = point.buffer(1, cap_style="square", mitre_limit=1)
-    ix = point.sindex.query(square, predicate="covers").T
-    ix = np.sort(ix)
-    s = pd.DataFrame(ix).drop_duplicates().reset_index(drop=True)
-    s = s.loc[np.where(s[0] != s[1])]
-    s = np.stack([point[s[0].values], point[s[1].values]]).T
-    r = gp.GeoSeries(map(LineString, s), crs=CRS)
-    if r.empty:
+    point, source, target = get_raster_edge(raster)
+    if len(source) == 0:
         return gp.GeoSeries(EMPTY, crs=CRS)
-    edge, node = get_source_target(combine_line(r).to_frame("geometry"))
+    ix, chain = get_chain(source, target, len(point))
+    r = gp.GeoSeries(linestrings(point[ix], indices=chain), crs=CRS)
+    edge, node = get_source_target(r.to_frame("geometry"))
     if knot:
         return combine_line(edge["geometry"])
     ix = edge.length > 2.0
-    connected = get_connected_class(edge.loc[~ix, ["source", "target"]])
-    if connected.empty:
+    if ix.all():
         return edge.loc[ix, "geometry"]
-    node = node.loc[connected.index].join(connected).sort_index()
+    source, target = edge.loc[~ix, ["source", "target"]].values.T
+    node["class"] = get_connected_class(source, target, len(node))
+    node = node[node["class"] >= 0]
     connected_edge = get_centre_edge(node)
     r = combine_line(pd.concat([connected_edge["geometry"], edge.loc[ix, "geometry"]]))
     return r[r.length > 2.0]
@@ -244,25 +497,78 @@ def split_centres(line, offset):
     return centre
 
 
+def get_centre(geometry, offset):
+    """get_centre: return LineString trimmed by offset at both ends, or empty where not
+    longer than twice offset, as one vectorized substring over all lines
+
+    args:
+      geometry: LineString numpy array
+      offset: trim distance [m]
+
+    returns:
+      centre LineString numpy array
+
+    """
+    r = np.full(len(geometry), EMPTY, dtype=object)
+    length = get_length(geometry)
+    ix = np.flatnonzero(length > 2.0 * offset)
+    if ix.size == 0:
+        return r
+    line, length = geometry[ix], length[ix]
+    start = get_coordinates(line_interpolate_point(line, offset))
+    end = get_coordinates(line_interpolate_point(line, length - offset))
+    xy, i = get_coordinates(line, return_index=True)
+    distance = np.hypot(*np.diff(xy, axis=0).T)
+    distance[np.diff(i) != 0] = 0.0
+    distance = np.concatenate([[0.0], np.cumsum(distance)])
+    first = np.searchsorted(i, np.arange(len(line)))
+    distance -= distance[first][i]
+    jx = (distance > offset) & (distance < length[i] - offset)
+    k = np.arange(len(line))
+    index = np.concatenate([k, i[jx], k])
+    inf = np.full(k.size, np.inf)
+    order = np.concatenate([-inf, distance[jx], inf])
+    xy = np.concatenate([start, xy[jx], end])[np.lexsort((order, index))]
+    r[ix] = linestrings(xy, indices=np.sort(index))
+    return r
+
+
+def get_group_union(this_gs):
+    """get_group_union: return union of geometry, run separately over each group of
+    geometry with intersecting envelopes found with an STRtree
+
+    args:
+      this_gs: GeoSeries
+
+    returns:
+      unioned single part GeoSeries
+
+    """
+    this_gs = this_gs[~this_gs.is_empty]
+    if this_gs.empty:
+        return gp.GeoSeries([], crs=CRS)
+    label = get_component(this_gs)
+    order = np.argsort(label, kind="stable")
+    _, count = np.unique(label, return_counts=True)
+    geometry = np.split(this_gs.values.to_numpy()[order], np.cumsum(count)[:-1])
+    r = [v[0] if len(v) == 1 else union_all(v) for v in geometry]
+    return gp.GeoSeries(r, crs=CRS).explode(index_parts=False).reset_index(drop=True)
+
+
 def get_segment_buffer(this_gs, radius):
     """get_segment:"""
-    r = this_gs.to_frame("geometry")
-    try:
-        r = gp.GeoSeries(this_gs.unary_union.geoms, crs=CRS)
-    except AttributeError:
-        r = gp.GeoSeries(this_gs, crs=CRS)
-    r = r.to_frame("geometry").reset_index(drop=True)
-    split_centre = partial(split_centres, offset=np.sqrt(1.5) * radius)
-    s = gp.GeoSeries(this_gs.map(split_centre), crs=CRS)
+    r = gp.GeoSeries(union_all(this_gs.values), crs=CRS)
+    r = r.explode(index_parts=False).to_frame("geometry").reset_index(drop=True)
+    offset = np.sqrt(1.5) * radius
+    s = np.array(this_gs.values, dtype=object)
+    ix = this_gs.geom_type.values == "LineString"
+    s[ix] = get_centre(s[ix], offset)
+    s[~ix] = [split_centres(i, offset) for i in s[~ix]]
+    s = gp.GeoSeries(s, crs=CRS)
     if s.is_empty.all():
         return r.buffer(0.612, 64, join_style="mitre", cap_style="round")
     s = s.buffer(radius, 0, join_style="round", cap_style="round")
-    ix = s.is_empty.values
-    s = s[~ix].reset_index(drop=True)
-    try:
-        s = gp.GeoSeries(s.unary_union.geoms, crs=CRS)
-    except AttributeError:
-        s = gp.GeoSeries(s.unary_union, crs=CRS)
+    s = get_group_union(s)
     i, j = r.sindex.query(s, predicate="intersects")
     r["class"] = -1
     r.loc[j, "class"] = s.index[i]
@@ -275,36 +581,336 @@ def get_segment_buffer(this_gs, radius):
     q = r[ix].buffer(0.612, 64, join_style="mitre", cap_style="round")
     if p.is_empty.all():
         return q
-    p = gp.GeoSeries(p.unary_union.geoms, crs=CRS)
-    p = p.buffer(radius, join_style="round", cap_style="round")
-    try:
-        p = gp.GeoSeries(p.unary_union.geoms, crs=CRS)
-    except AttributeError:
-        p = gp.GeoSeries(p.unary_union, crs=CRS)
+    p = p["geometry"].buffer(radius, join_style="round", cap_style="round")
+    p = get_group_union(p)
     r = pd.concat([p, q])
     return r
 
 
+def skeletonize_raster(raster_im):
+    """skeletonize_raster: return skeletonized raster
+
+    args:
+      raster_im: raster buffer numpy array
+
+    returns:
+      skeleton numpy array raster
+
+    """
+    from skimage.morphology import skeletonize
+
+    with stage("skeletonize", raster_im) as s:
+        r = skeletonize(raster_im).astype(np.uint8)
+        s.set_output(r)
+    return r
+
+
+def vectorize_skeleton(skeleton_im, transform, parameter):
+    """vectorize_skeleton: return skeleton lines in projected coordinates from skeleton
+    raster
+
+    args:
+      skeleton_im: skeleton numpy array raster
+      transform: shapely affine transform
+      parameter: knot and tolerance parameter dict
+
+    returns:
+      skeleton LineString GeoDataFrame
+
+    """
+    with stage("vectorize", skeleton_im) as s:
+        sx_line = get_raster_line(skeleton_im, parameter["knot"])
+        tolerance = parameter["tolerance"]
+        r = sx_to_nx(sx_line, transform, simplify=tolerance)
+        s.set_output(r)
+    return r
+
+
+def get_skeleton_line(raster_im, transform, parameter):
+    """get_skeleton_line: return skeleton lines in projected coordinates from raster
+
+    args:
+      raster_im: raster buffer numpy array
+      transform: shapely affine transform
+      parameter: knot and tolerance parameter dict
+
+    returns:
+      skeleton LineString GeoDataFrame
+
+    """
+    skeleton_im = skeletonize_raster(raster_im)
+    return vectorize_skeleton(skeleton_im, transform, parameter)
+
+
+def get_skeleton_pixel(nx_geometry, transform, shape, scale, radius=None, window=None):
+    """get_skeleton_pixel: return flat skeleton pixel index from rasterized geometry
+
+    args:
+      nx_geometry: buffer Polygon GeoSeries, or LineString GeoSeries if radius
+      transform: rasterio affine transformation
+      shape: output buffer px size
+      scale: raster scale
+      radius: distance transform buffer radius [m] (default value = None)
+      window: network pixel grid slices (default value = None)
+
+    returns:
+      skeleton pixel index numpy array
+
+    """
+    with stage("rasterize", nx_geometry) as s:
+        raster_im = get_raster(nx_geometry, transform, shape, scale, radius, window)
+        s.set_output(raster_im)
+    return np.flatnonzero(skeletonize_raster(raster_im))
+
+
+def skeletonize_component(nx_geometry, parameter, bound=None):
+    """skeletonize_component: return skeleton lines from buffer Polygon rasterized in a
+    window aligned to the pixel grid of bound
+
+    args:
+      nx_geometry: buffer Polygon GeoSeries, or LineString GeoSeries if distance
+      parameter: scale, knot, tolerance, buffer, distance and cache parameter dict
+      bound: network boundary corner points (default = None)
+
+    returns:
+      skeleton LineString GeoDataFrame
+
+    """
+    scale = parameter["scale"]
+    radius = parameter["buffer"] if parameter.get("distance") else None
+    origin = None if bound is None else bound[[0, 3]]
+    r_matrix, s_matrix, out_shape = get_affine_transform(
+        nx_geometry, scale, origin, offset=radius or 0.0
+    )
+    window = None if bound is None else get_window(s_matrix, bound, scale, out_shape)
+    shapely_transform = partial(affine_transform, matrix=s_matrix)
+    key = get_key(parameter, nx_geometry, scale, radius, out_shape, s_matrix, bound)
+    pixel = cached(
+        "skeleton",
+        parameter,
+        key,
+        get_skeleton_pixel,
+        nx_geometry,
+        r_matrix,
+        out_shape,
+        scale,
+        radius,
+        window,
+    )
+    skeleton_im = np.zeros(out_shape, dtype=np.uint8)
+    skeleton_im.flat[pixel] = 1
+    return vectorize_skeleton(skeleton_im, shapely_transform, parameter)
+
+
+def sweep_component(nx_geometry, parameter, bound=None):
+    """sweep_component: return skeleton lines for each sweep radius from LineString
+    burnt once into a window aligned to the pixel grid of bound and a shared distance
+    transform
+
+    args:
+      nx_geometry: LineString GeoSeries
+      parameter: scale, knot, tolerance and sweep parameter dict
+      bound: network boundary corner points (default = None)
+
+    returns:
+      radius skeleton LineString GeoDataFrame dict
+
+    """
+    from rasterio.features import rasterize
+
+    scale = parameter["scale"]
+    radius = sorted(set(parameter["sweep"]))
+    origin = None if bound is None else bound[[0, 3]]
+    r_matrix, s_matrix, out_shape = get_affine_transform(
+        nx_geometry, scale, origin, offset=radius[-1]
+    )
+    window = None if bound is None else get_window(s_matrix, bound, scale, out_shape)
+    shapely_transform = partial(affine_transform, matrix=s_matrix)
+    with stage("rasterize", nx_geometry) as s:
+        raster_im = rasterize(
+            nx_geometry.values,
+            transform=r_matrix,
+            out_shape=out_shape,
+            all_touched=True,
+        )
+        mask = get_distance_mask(raster_im, np.asarray(radius) * scale)
+        s.set_output(mask)
+    r = {}
+    for k, v in zip(radius, mask):
+        raster_im = fill_small_hole(v, scale, window)
+        r[k] = get_skeleton_line(raster_im, shapely_transform, parameter)
+    return r
+
+
+def map_component(fn, component, workers=1):
+    """map_component: return fn applied to each component, in a process pool if workers
+
+    args:
+      fn: component function
+      component: GeoSeries list
+      workers: process pool size (default value = 1)
+
+    returns:
+      fn result list in component order
+
+    """
+    if workers > 1 and len(component) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fn, component))
+    return [fn(i) for i in component]
+
+
+def concat_component(line):
+    """concat_component: return component skeleton lines concatenated in order, without
+    the empty lines of components that skeletonize to isolated pixels
+
+    args:
+      line: skeleton LineString GeoDataFrame list
+
+    returns:
+      skeleton LineString GeoDataFrame
+
+    """
+    r = pd.concat(line)
+    return r[~r.is_empty].reset_index(drop=True)
+
+
+def get_line_component(this_gs, distance, offset=0.0):
+    """get_line_component: return non-empty geometry split into components within
+    distance, and shared pixel grid boundary
+
+    args:
+      this_gs: GeoSeries
+      distance: component separation distance
+      offset: distance to extend boundary [m] (default value = 0.0)
+
+    returns:
+      GeoSeries list and boundary corner point numpy array
+
+    """
+    r = this_gs[~this_gs.is_empty].reset_index(drop=True)
+    if r.empty:
+        return [], None
+    bound = r.total_bounds + np.asarray([-1.0, -1.0, 1.0, 1.0]) * offset
+    label = get_component(r, distance)
+    return [r[label == i] for i in np.unique(label)], bound
+
+
 def skeletonize_frame(this_gs, parameter):
     """skeltonize_frame:"""
     radius = parameter["buffer"]
+    segment = parameter["segment"]
     scale = parameter["scale"]
-    if parameter["segment"]:
-        nx_geometry = get_segment_buffer(this_gs, radius=radius)
+    if parameter.get("distance"):
+        if segment:
+            raise ValueError("distance rasterization does not support segment")
+        component, bound = get_line_component(
+            this_gs, 2.0 * radius + 2.0 / scale, offset=radius
+        )
     else:
-        nx_geometry = get_geometry_buffer(this_gs, radius=radius)
-    r_matrix, s_matrix, out_shape = get_affine_transform(nx_geometry, scale)
-    shapely_transform = partial(affine_transform, matrix=s_matrix)
-    skeleton_im = get_skeleton(nx_geometry, r_matrix, out_shape, scale)
-    nx_point = get_raster_point(skeleton_im)
-    sx_line = get_raster_line(nx_point, parameter["knot"])
-    tolerance = parameter["tolerance"]
-    return sx_to_nx(sx_line, shapely_transform, simplify=tolerance)
+        with stage("buffer", this_gs) as s:
+            workers = parameter.get("workers", 1)
+            fn = partial(get_geometry_buffer, workers=workers)
+            fn = get_segment_buffer if segment else fn
+            key = get_key(parameter, this_gs, radius, segment)
+            nx_geometry = cached("buffer", parameter, key, fn, this_gs, radius)
+            s.set_output(nx_geometry)
+        component, bound = get_line_component(nx_geometry, 2.0 / scale)
+    if not component:
+        return gp.GeoSeries(EMPTY, crs=CRS).to_frame("geometry")
+    get_line = partial(skeletonize_component, parameter=parameter, bound=bound)
+    r = map_component(get_line, component, parameter.get("workers", 1))
+    return concat_component(r)
+
+
+def skeletonize_sweep(this_gs, parameter):
+    """skeletonize_sweep: return skeleton lines for each buffer radius in sweep from a
+    single rasterization and distance transform
+
+    args:
+      this_gs: LineString GeoSeries
+      parameter: scale, knot, tolerance, workers and sweep parameter dict
+
+    returns:
+      radius skeleton LineString GeoDataFrame dict
+
+    """
+    if parameter.get("segment"):
+        raise ValueError("sweep rasterization does not support segment")
+    radius = sorted(set(parameter["sweep"]))
+    scale = parameter["scale"]
+    component, bound = get_line_component(
+        this_gs, 2.0 * radius[-1] + 2.0 / scale, offset=radius[-1]
+    )
+    if not component:
+        empty = gp.GeoSeries(EMPTY, crs=CRS).to_frame("geometry")
+        return {k: empty for k in radius}
+    get_line = partial(sweep_component, parameter=parameter, bound=bound)
+    r = map_component(get_line, component, parameter.get("workers", 1))
+    return {k: concat_component([v[k] for v in r]) for k in radius}
+
+
+def simplify_line(this_gf, tolerance):
+    """simplify_line: return LineString GeoDataFrame simplified to each tolerance
+
+    args:
+      this_gf: LineString GeoDataFrame
+      tolerance: simplify tolerance list [m]
+
+    returns:
+      tolerance LineString GeoDataFrame dict
+
+    """
+    r = {}
+    for k in tolerance:
+        r[k] = this_gf.copy()
+        if k > 0.0:
+            r[k]["geometry"] = this_gf["geometry"].simplify(k)
+    return r
+
+
+def skeletonize_tolerance(this_gs, parameter):
+    """skeletonize_tolerance: return skeleton lines for each simplify tolerance, and
+    each sweep radius if sweep, from a single skeleton
+
+    args:
+      this_gs: LineString GeoSeries
+      parameter: parameter dict with tolerance list
+
+    returns:
+      tolerance, or radius and tolerance tuple, LineString GeoDataFrame dict
+
+    """
+    tolerance = sorted(set(np.atleast_1d(parameter["tolerance"]).tolist()))
+    base = {**parameter, "tolerance": 0.0}
+    if base.get("sweep"):
+        line = skeletonize_sweep(this_gs, base)
+    else:
+        line = {None: skeletonize_frame(this_gs, base)}
+    r = {}
+    with stage("simplify", line) as s:
+        for k, v in line.items():
+            for t, w in simplify_line(v, tolerance).items():
+                r[t if k is None else (k, t)] = w
+        s.set_output(r)
+    return r
 
 
 set_precision_pointone = partial(set_precision, grid_size=0.1)
 
 
+def get_suffix(key):
+    """get_suffix: return output layer suffix from radius or tolerance key
+
+    args:
+      key: number or tuple of numbers
+
+    returns:
+      layer suffix str
+    """
+    return "".join(f"_{k:g}" for k in np.atleast_1d(key))
+
+
 def main():
     """main: load GeoJSON file, use skeletonize buffer to simplify network, and output
     input, simplified and primal network as GeoPKG layers
@@ -316,20 +922,25 @@ def main():
        None
 
     """
-    log("start\t")
+    pd.set_option("display.max_columns", None)
     parameter = get_args()
-    base_nx = get_base_geojson(parameter["inpath"])
-    log("read geojson")
-    outpath = parameter["outpath"]
-    write_dataframe(base_nx, outpath, layer="input")
-    log("process\t")
-    nx_line = skeletonize_frame(base_nx["geometry"], parameter)
-    log("write simple")
-    write_dataframe(nx_line, outpath, "line")
-    log("write primal")
-    mx_line = get_nx(nx_line["geometry"]).to_frame("geometry")
-    write_dataframe(mx_line, outpath, "primal")
-    log("stop\t")
+    with Report(trace=bool(parameter["report"]), verbose=True) as report:
+        with stage("read") as s:
+            base_nx = get_base_geojson(parameter["inpath"], bbox=parameter["bbox"])
+            s.set_output(base_nx)
+        if isinstance(parameter["tolerance"], (list, tuple)):
+            nx_line = skeletonize_tolerance(base_nx["geometry"], parameter)
+            nx_line = {get_suffix(k): v for k, v in nx_line.items()}
+        elif parameter["sweep"]:
+            nx_line = skeletonize_sweep(base_nx["geometry"], parameter)
+            nx_line = {get_suffix(k): v for k, v in nx_line.items()}
+        else:
+            nx_line = skeletonize_frame(base_nx["geometry"], parameter)
+        with stage("write", nx_line):
+            layer = get_output_layer(base_nx, nx_line, parameter)
+            write_layer(layer, parameter["outpath"])
+    if parameter["report"]:
+        report.write(parameter["report"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,256 @@
+"""stage.py: named stage timing, memory and geometry count instrumentation"""
+
+import contextvars
+import datetime as dt
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+from shapely import get_num_coordinates
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CURRENT = contextvars.ContextVar("report", default=None)
+
+
+def get_rss():
+    """get_rss: return process current resident set size in bytes, or None where
+    /proc/self/statm is not available
+
+    returns:
+      RSS bytes
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as fin:
+            return int(fin.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_max_rss():
+    """get_max_rss: return process lifetime peak resident set size in bytes, or None
+
+    returns:
+      peak RSS bytes
+    """
+    if resource is None:
+        return None
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return int(r)
+    return int(r) * 1024
+
+
+def get_difference(end, start):
+    """get_difference: return end less start, or None if either is None"""
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+def get_count(geometry):
+    """get_count: return geometry and vertex count, or raster pixel count
+
+    args:
+      geometry: GeoDataFrame, GeoSeries, geometry, geometry array, raster array or
+        dict of these
+
+    returns:
+      count dict
+    """
+    if geometry is None:
+        return None
+    if isinstance(geometry, dict):
+        r = [getattr(v, "geometry", v) for v in geometry.values()]
+        r = np.concatenate([np.asarray(v).reshape(-1) for v in r])
+    else:
+        r = np.asarray(getattr(geometry, "geometry", geometry))
+    if r.dtype != object:
+        return {"pixel": int(np.count_nonzero(r)), "shape": list(r.shape)}
+    r = r.reshape(-1)
+    return {"geometry": int(r.size), "vertex": int(get_num_coordinates(r).sum())}
+
+
+class Stage:
+    """Stage: a named span recording wall and CPU time, memory and geometry count
+
+    rss_start and rss_end are the current resident set size at stage entry and exit,
+    and rss_growth the rise in the process peak resident set size during the stage,
+    zero unless the stage sets a new process high-water mark
+    """
+
+    def __init__(self, name, geometry=None, active=True):
+        self.name = name
+        self.active = active
+        self.input = get_count(geometry) if active else None
+        self.output = None
+        self.wall = None
+        self.cpu = None
+        self.rss_start = None
+        self.rss_end = None
+        self.rss_growth = None
+        self.trace = None
+        self.start = None
+
+    def set_output(self, geometry):
+        """set_output: record geometry flowing out of the stage
+
+        args:
+          geometry: GeoDataFrame, GeoSeries, geometry, geometry array or raster array
+
+        returns:
+          None
+        """
+        if self.active:
+            self.output = get_count(geometry)
+
+    def to_dict(self):
+        """to_dict: return stage record as dict"""
+        return {
+            "name": self.name,
+            "start": self.start,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "rss_start": self.rss_start,
+            "rss_end": self.rss_end,
+            "rss_growth": self.rss_growth,
+            "trace_peak": self.trace,
+            "input": self.input,
+            "output": self.output,
+        }
+
+
+class Report:
+    """Report: collect Stage records for one job
+
+    args:
+      trace: record per stage tracemalloc peaks (default value = True)
+      verbose: print each stage on completion (default value = False)
+    """
+
+    def __init__(self, trace=True, verbose=False):
+        self.trace = trace
+        self.verbose = verbose
+        self.stage = []
+        self.start = time.perf_counter()
+        self.created = dt.datetime.now().isoformat()
+        self.token = None
+        self.stack = []
+        self.started_trace = False
+
+    def __enter__(self):
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_trace = True
+        self.token = CURRENT.set(self)
+        return self
+
+    def __exit__(self, *_):
+        CURRENT.reset(self.token)
+        if self.started_trace:
+            tracemalloc.stop()
+            self.started_trace = False
+
+    def get_summary(self):
+        """get_summary: return per stage name totals
+
+        returns:
+          stage name summary dict
+        """
+        r = {}
+        for s in self.stage:
+            v = r.setdefault(s.name, {"count": 0, "wall": 0.0, "cpu": 0.0})
+            v["count"] += 1
+            v["wall"] += s.wall
+            v["cpu"] += s.cpu
+            for k, key in [("rss_end", "rss_max"), ("trace", "trace_peak")]:
+                value = getattr(s, k)
+                if value is not None:
+                    v[key] = max(v.get(key, 0), value)
+            if s.rss_growth is not None:
+                v["rss_growth"] = v.get("rss_growth", 0) + s.rss_growth
+        return r
+
+    def to_dict(self):
+        """to_dict: return report as dict"""
+        return {
+            "created": self.created,
+            "wall": time.perf_counter() - self.start,
+            "stage": [s.to_dict() for s in self.stage],
+            "summary": self.get_summary(),
+        }
+
+    def write(self, filepath):
+        """write: write report as JSON
+
+        args:
+          filepath: JSON output path
+
+        returns:
+          None
+        """
+        with open(filepath, "w", encoding="utf-8") as fout:
+            json.dump(self.to_dict(), fout, indent=2)
+
+
+def get_trace_peak():
+    """get_trace_peak: return tracemalloc peak or None if not tracing"""
+    if not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[1]
+
+
+def reset_trace_peak():
+    """reset_trace_peak: reset tracemalloc peak where supported"""
+    if tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+
+@contextmanager
+def stage(name, geometry=None):
+    """stage: record a named processing stage in the current Report, if any
+
+    args:
+      name: stage name
+      geometry: geometry flowing into the stage (default value = None)
+
+    returns:
+      Stage context manager
+    """
+    report = CURRENT.get()
+    if report is None:
+        yield Stage(name, active=False)
+        return
+    r = Stage(name, geometry)
+    peak = get_trace_peak()
+    for s in report.stack:
+        s.trace = max(s.trace or 0, peak or 0)
+    reset_trace_peak()
+    report.stack.append(r)
+    r.rss_start, max_rss = get_rss(), get_max_rss()
+    r.start = time.perf_counter() - report.start
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield r
+    finally:
+        r.wall = time.perf_counter() - wall
+        r.cpu = time.process_time() - cpu
+        r.rss_end = get_rss()
+        r.rss_growth = get_difference(get_max_rss(), max_rss)
+        peak = get_trace_peak()
+        if peak is not None:
+            r.trace = max(r.trace or 0, peak)
+        report.stack.pop()
+        if report.stack:
+            parent = report.stack[-1]
+            parent.trace = max(parent.trace or 0, r.trace or 0)
+        report.stage.append(r)
+        if report.verbose:
+            print(f"{name}\t{dt.timedelta(seconds=r.start + r.wall)}")
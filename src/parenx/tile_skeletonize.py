@@ -2,28 +2,55 @@
 """tile_skeletonize: tile skeletonize geometry"""
 
 import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 
 import geopandas as gp
 import numpy as np
 import pandas as pd
-from pyogrio import write_dataframe
-from shapely import STRtree, box, clip_by_rect, disjoint, voronoi_polygons
-from shapely.geometry import LineString, MultiPoint
+from shapely import (
+    STRtree,
+    box,
+    clip_by_rect,
+    from_wkb,
+    get_coordinates,
+    get_parts,
+    to_wkb,
+    union_all,
+)
+from shapely.geometry import LineString
+
+from pyogrio import read_dataframe
 
+from .cache import CACHE_SIZE, get_digest
 from .shared import (
     combine_line,
     CRS,
     get_base_geojson,
     get_geometry_buffer,
-    get_nx,
+    get_output_layer,
     get_source_target,
-    log,
+    USE_ARROW,
+    write_layer,
 )
+from .stage import Report, stage
 
 from .skeletonize import skeletonize_frame
 
-pd.set_option("display.max_columns", None)
+CHECKPOINT = [
+    "tolerance",
+    "buffer",
+    "side_length",
+    "scale",
+    "knot",
+    "segment",
+    "distance",
+    "budget",
+]
+MANIFEST = "manifest.json"
+
 
 def get_args():
     """get_args: get command line parameters
@@ -48,6 +75,30 @@ def get_args():
     parser.add_argument("--scale", help="raster scale", type=float, default=1.0)
     parser.add_argument("--knot", help="keep image knots", action="store_true")
     parser.add_argument("--segment", help="segment", action="store_true")
+    parser.add_argument("--workers", help="tile process pool size", type=int, default=1)
+    parser.add_argument(
+        "--budget", help="adaptive quadtree tile vertex budget", type=int, default=None
+    )
+    parser.add_argument(
+        "--no-primal", help="skip primal network output", action="store_true"
+    )
+    parser.add_argument(
+        "--no-input", help="skip input network output", action="store_true"
+    )
+    parser.add_argument(
+        "--bbox",
+        help="EPSG:27700 input filter [m]",
+        type=float,
+        nargs=4,
+        metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+        default=None,
+    )
+    parser.add_argument("--report", help="JSON stage report path", type=str)
+    parser.add_argument("--checkpoint", help="tile checkpoint directory", type=str)
+    parser.add_argument("--cache", help="stage cache directory", type=str)
+    parser.add_argument(
+        "--cache-size", help="stage cache size [MB]", type=float, default=CACHE_SIZE
+    )
     args = parser.parse_args()
     return {
         "inpath": args.inpath,
@@ -58,28 +109,114 @@ def get_args():
         "scale": args.scale,
         "knot": args.knot,
         "segment": args.segment,
+        "workers": args.workers,
+        "budget": args.budget,
+        "primal": not args.no_primal,
+        "input": not args.no_input,
+        "bbox": args.bbox,
+        "report": args.report,
+        "checkpoint": args.checkpoint,
+        "cache": args.cache,
+        "cache_size": args.cache_size,
     }
 
 
 def get_square(this_gf, side_length=2000.0):
-    """get_square: tile a geometry with squares default 4km² tiles
+    """get_square: tile a geometry with a grid of side_length / 2 squares centred on its
+    bounds, keeping squares an STRtree query finds intersect the geometry
+
+    args:
+      this_gf: GeoDataFrame
+      side_length: grid size [m] (default value = 2000.0)
+
     returns:
       square tile GeoSeries
     """
-    dimension = np.asarray(this_gf.union_all().bounds).reshape(-1, 2)
-    outer_geometry = box(*dimension.reshape(-1))
-    n, m = np.ceil(np.diff(dimension, axis=0).reshape(-1) / side_length + 2.0).astype(
-        int
-    )
-    x_centre, y_centre = np.mean(dimension, axis=0)
-    xn = x_centre + np.linspace(-n, n, 2 * n + 1) * side_length / 2.0
-    yn = y_centre + np.linspace(-m, m, 2 * m + 1) * side_length / 2.0
-    mesh = np.r_[np.meshgrid(xn, yn)].reshape(2, -1)
-    point = MultiPoint(mesh.T)
-    r = voronoi_polygons(point, extend_to=outer_geometry)
-    ix = disjoint(r.geoms, outer_geometry)
-    r = gp.GeoSeries(r.geoms, crs=CRS)
-    return r[~ix]
+    geometry = this_gf.geometry.values
+    dimension = np.asarray(geometry.total_bounds).reshape(-1, 2)
+    centre = np.mean(dimension, axis=0)
+    half = side_length / 4.0
+    k_min = np.ceil((dimension[0] - centre) / (2.0 * half) - 0.5)
+    k_max = np.floor((dimension[1] - centre) / (2.0 * half) + 0.5)
+    xn, yn = [
+        centre[i] + np.arange(k_min[i], k_max[i] + 1.0) * side_length / 2.0
+        for i in range(2)
+    ]
+    x, y = np.meshgrid(xn, yn)
+    x, y = x.reshape(-1), y.reshape(-1)
+    r = box(x - half, y - half, x + half, y + half)
+    i, _ = STRtree(geometry).query(r, predicate="intersects")
+    return gp.GeoSeries(r[np.unique(i)], crs=CRS)
+
+
+def get_cell_label(xy, cell):
+    """get_cell_label: return the grid square index of each vertex, with square bounds
+    half-open so a vertex on a shared edge counts in the square above or right of it,
+    and closed on the outer grid edge
+
+    args:
+      xy: (n, 2) vertex coordinate numpy array
+      cell: (m, 4) grid square bounds numpy array
+
+    returns:
+      square index int numpy array, -1 for vertices outside the squares
+    """
+    side = cell[0, 2] - cell[0, 0]
+    origin = cell[:, :2].min(axis=0)
+    k = np.rint((cell[:, :2] - origin) / side).astype(np.int64)
+    shape = k.max(axis=0) + 1
+    lookup = np.full(shape, -1, dtype=np.int64)
+    lookup[k[:, 0], k[:, 1]] = np.arange(len(cell))
+    j = np.floor((xy - origin) / side).astype(np.int64)
+    j = np.clip(j, 0, shape - 1)
+    return lookup[j[:, 0], j[:, 1]]
+
+
+def get_quadtree(this_gf, side_length=2000.0, budget=None, min_length=128.0):
+    """get_quadtree: tile a geometry with squares, recursively split into quadrants
+    while they hold more than budget vertices and are longer than min_length, with
+    vertices binned to half-open squares from the coordinate array
+
+    args:
+      this_gf: LineString GeoDataFrame
+      side_length: square grid size [m] (default value = 2000.0)
+      budget: tile vertex budget, uniform squares if None (default value = None)
+      min_length: smallest tile side [m] (default value = 128.0)
+
+    returns:
+      square tile GeoSeries
+    """
+    r = get_square(this_gf, side_length)
+    if budget is None or r.empty:
+        return r
+    xy = get_coordinates(this_gf.geometry.values)
+    cell = np.asarray(r.bounds)
+    label = get_cell_label(xy, cell)
+    xy, label = xy[label >= 0], label[label >= 0]
+    r = []
+    while len(cell):
+        count = np.bincount(label, minlength=len(cell))
+        half = (cell[:, 2] - cell[:, 0]) / 2.0
+        ix = (count > budget) & (half >= min_length)
+        r.append(cell[~ix])
+        rank = np.full(len(cell), -1, dtype=np.int64)
+        rank[ix] = np.arange(np.count_nonzero(ix))
+        cell, half = cell[ix], half[ix, np.newaxis]
+        x0, y0, x1, y1 = cell.T
+        xm, ym = x0 + half[:, 0], y0 + half[:, 0]
+        label = rank[label]
+        xy, label = xy[label >= 0], label[label >= 0]
+        quadrant = (xy[:, 0] >= xm[label]) + 2 * (xy[:, 1] >= ym[label])
+        label = quadrant * len(cell) + label
+        cell = np.concatenate(
+            [
+                np.stack([x0, y0, xm, ym], axis=1),
+                np.stack([xm, y0, x1, ym], axis=1),
+                np.stack([x0, ym, xm, y1], axis=1),
+                np.stack([xm, ym, x1, y1], axis=1),
+            ]
+        )
+    return gp.GeoSeries(box(*np.concatenate(r).T), crs=CRS)
 
 
 def clip_geometry(*bound, geometry):
@@ -89,14 +226,33 @@ def clip_geometry(*bound, geometry):
 
 
 def get_tile_extent(this_nx, square, radius):
-    """get_tile_extent:"""
-    get_clip_geometry = partial(clip_geometry, geometry=this_nx.union_all())
+    """get_tile_extent: return input lines clipped to each square buffered by three
+    radius, from an STRtree query of the features in each tile
+
+    args:
+      this_nx: LineString GeoDataFrame
+      square: square tile GeoSeries
+      radius: buffer radius [m]
+
+    returns:
+      exploded tile LineString GeoDataFrame with square "id"
+    """
+    geometry = this_nx.geometry.values
     extent = square.buffer(3.0 * radius, join_style="mitre")
-    r = gp.GeoSeries(extent.bounds.apply(get_clip_geometry, axis=1), crs=CRS)
-    ix = r.is_empty
-    r = r[~ix].to_frame("geometry")
-    r["id"] = r.index
-    r = r.explode(index_parts=True)
+    i, j = STRtree(geometry).query(extent.values)
+    r, key = [], []
+    for k in np.unique(i):
+        bound = extent.iloc[k].bounds
+        v = union_all(clip_by_rect(geometry[j[i == k]], *bound))
+        if v.is_empty:
+            continue
+        v = get_parts(v)
+        r.append(v)
+        key.append(np.full(len(v), square.index[k]))
+    if not r:
+        return gp.GeoDataFrame({"id": []}, geometry=[], crs=CRS)
+    r = gp.GeoSeries(np.concatenate(r), crs=CRS).to_frame("geometry")
+    r["id"] = np.concatenate(key)
     return r
 
 
@@ -118,51 +274,183 @@ def get_gap_fill(this_gf, square, radius):
     return r.to_frame("geometry")
 
 
+def skeletonize_tile(geometry, bound, parameter):
+    """skeletonize_tile: return skeleton lines clipped to tile bounds
+
+    args:
+      geometry: tile LineString WKB numpy array
+      bound: tile square bounds
+      parameter: skeletonize parameter dict
+
+    returns:
+      clipped skeleton LineString WKB numpy array
+    """
+    this_gs = gp.GeoSeries(from_wkb(geometry), crs=CRS)
+    r = skeletonize_frame(this_gs, {**parameter, "workers": 1})
+    r = r[~r.is_empty]
+    if r.empty:
+        return to_wkb(np.asarray([], dtype=object))
+    r = clip_geometry(bound, geometry=r.union_all())
+    return to_wkb(get_parts(r))
+
+
+def map_tile(fn, tile, square, workers=1):
+    """map_tile: yield tile id and fn result in tile order, from a process pool if
+    workers
+
+    args:
+      fn: tile function taking tile WKB and square bounds
+      tile: tile extent GeoDataFrame with "id" column
+      square: square tile GeoSeries
+      workers: process pool size (default value = 1)
+
+    returns:
+      tile id and fn result generator
+    """
+    key, geometry = [], []
+    for i, j in tile.groupby("id"):
+        key.append(i)
+        geometry.append(to_wkb(j["geometry"].values))
+    bound = [square[i].bounds for i in key]
+    if workers > 1 and len(key) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from zip(key, executor.map(fn, geometry, bound))
+    else:
+        yield from zip(key, map(fn, geometry, bound))
+
+
+def get_manifest(this_nx, parameter):
+    """get_manifest: return checkpoint manifest for input and tile parameters
+
+    args:
+      this_nx: input LineString GeoDataFrame or GeoSeries
+      parameter: tile parameter dict
+
+    returns:
+      manifest dict with empty tile record
+    """
+    return {
+        "input": get_digest(this_nx.geometry),
+        "parameter": {k: parameter.get(k) for k in CHECKPOINT},
+        "tile": {},
+    }
+
+
+def read_checkpoint(path, manifest):
+    """read_checkpoint: return completed tile line count by id, if the checkpoint
+    manifest matches input and parameters
+
+    args:
+      path: checkpoint directory
+      manifest: manifest dict from get_manifest
+
+    returns:
+      tile id line count dict
+    """
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as fin:
+            r = json.load(fin)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if r["input"] != manifest["input"] or r["parameter"] != manifest["parameter"]:
+        print(f"{path}: checkpoint parameters differ, restarting")
+        return {}
+    return {int(k): v for k, v in r["tile"].items()}
+
+
+def write_checkpoint(path, manifest, i, line):
+    """write_checkpoint: write tile lines and atomically record tile in manifest
+
+    args:
+      path: checkpoint directory
+      manifest: manifest dict updated with tile line count
+      i: tile id
+      line: tile LineString GeoDataFrame
+
+    returns:
+      None
+    """
+    if not line.empty:
+        filepath = os.path.join(path, f"tile_{i:05d}.gpkg")
+        write_layer({"line": line}, f"{filepath}.tmp.gpkg", spatial_index=False)
+        os.replace(f"{filepath}.tmp.gpkg", filepath)
+    manifest["tile"][str(i)] = len(line)
+    filepath = os.path.join(path, MANIFEST)
+    with open(f"{filepath}.tmp", "w", encoding="utf-8") as fout:
+        json.dump(manifest, fout, indent=2)
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+def read_tile(path, i):
+    """read_tile: return checkpoint tile lines
+
+    args:
+      path: checkpoint directory
+      i: tile id
+
+    returns:
+      tile LineString GeoDataFrame
+    """
+    filepath = os.path.join(path, f"tile_{i:05d}.gpkg")
+    return read_dataframe(filepath, layer="line", use_arrow=USE_ARROW)
+
+
 def skeletonize_tiles(this_nx, parameter):
     """tile_skeletonize:"""
     radius = parameter["buffer"]
-    square = get_square(this_nx, parameter["side_length"])
-    tile = get_tile_extent(this_nx, square, radius)
+    with stage("tile", this_nx) as s:
+        square = get_quadtree(
+            this_nx,
+            parameter["side_length"],
+            parameter.get("budget"),
+            16.0 * radius,
+        )
+        tile = get_tile_extent(this_nx, square, radius)
+        s.set_output(tile)
     tile = tile.reset_index(drop=True)
-    r = []
+    r = {}
     n = tile["id"].max()
-    for i, j in tile.groupby("id"):
+    path = parameter.get("checkpoint")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        manifest = get_manifest(this_nx, parameter)
+        done = read_checkpoint(path, manifest)
+        manifest["tile"] = {str(k): v for k, v in done.items()}
+        r = {i: read_tile(path, i) for i, v in done.items() if v > 0}
+        tile = tile[~tile["id"].isin(list(done))]
+    fn = partial(skeletonize_tile, parameter=parameter)
+    for i, v in map_tile(fn, tile, square, parameter.get("workers", 1)):
         print(f"{str(i).zfill(4)}\t{str(n).zfill(4)}")
-        v = skeletonize_frame(j["geometry"], parameter)
-        v = v[~v.is_empty]
-        if v.empty:
-            continue
-        try:
-            v = clip_geometry(square[i].bounds, geometry=v.union_all()).geoms
-        except AttributeError:
-            v = clip_geometry(square[i].bounds, geometry=v.union_all())
-        v = gp.GeoSeries(v, crs=CRS).to_frame("geometry")
+        v = gp.GeoSeries(from_wkb(v), crs=CRS).to_frame("geometry")
         v["id"] = i
-        r.append(v)
-    r = pd.concat(r)
-    s = get_gap_fill(r, square, radius)
-    r = pd.concat([r, s])
-    r = combine_line(r["geometry"]).to_frame("geometry")
-    r["geometry"] = r.simplify(parameter["tolerance"])
+        if path:
+            write_checkpoint(path, manifest, i, v)
+        if not v.empty:
+            r[i] = v
+    r = pd.concat([r[i] for i in sorted(r)])
+    with stage("gapfill", r) as s:
+        v = get_gap_fill(r, square, radius)
+        r = pd.concat([r, v])
+        r = combine_line(r["geometry"]).to_frame("geometry")
+        r["geometry"] = r.simplify(parameter["tolerance"])
+        s.set_output(r)
     return r
 
 
 def main():
     """main: function"""
-    log("start\t")
+    pd.set_option("display.max_columns", None)
     parameter = get_args()
-    base_nx = get_base_geojson(parameter["inpath"])
-    log("read geojson")
-    outpath = parameter["outpath"]
-    write_dataframe(base_nx, outpath, layer="input")
-    log("process\t")
-    nx_line = skeletonize_tiles(base_nx, parameter)
-    log("write simple")
-    write_dataframe(nx_line, outpath, "line")
-    log("write primal")
-    mx_line = get_nx(nx_line["geometry"]).to_frame("geometry")
-    write_dataframe(mx_line, outpath, "primal")
-    log("stop\t")
+    with Report(trace=bool(parameter["report"]), verbose=True) as report:
+        with stage("read") as s:
+            base_nx = get_base_geojson(parameter["inpath"], bbox=parameter["bbox"])
+            s.set_output(base_nx)
+        nx_line = skeletonize_tiles(base_nx, parameter)
+        with stage("write", nx_line):
+            layer = get_output_layer(base_nx, nx_line, parameter)
+            write_layer(layer, parameter["outpath"])
+    if parameter["report"]:
+        report.write(parameter["report"])
 
 
 if __name__ == "__main__":
@@ -7,23 +7,23 @@ from functools import partial
 import geopandas as gp
 import numpy as np
 import pandas as pd
-from pyogrio import write_dataframe
 from shapely import box, get_coordinates, unary_union
 from shapely.geometry import LineString, MultiPoint, Point
 from shapely.ops import voronoi_diagram
 
+from .cache import CACHE_SIZE, cached, get_key
 from .shared import (
     combine_line,
     CRS,
     get_base_geojson,
     get_geometry_buffer,
-    get_nx,
+    get_output_layer,
     get_source_target,
-    log,
     set_precision_pointone,
+    write_layer,
 )
+from .stage import Report, stage
 
-pd.set_option("display.max_columns", None)
 
 def get_args():
     """get_args: get command line parameters
@@ -47,6 +47,28 @@ def get_args():
     parser.add_argument(
         "--tolerance", help="Voronoi snap distance", type=float, default=1.0
     )
+    parser.add_argument(
+        "--workers", help="buffer thread pool size", type=int, default=1
+    )
+    parser.add_argument(
+        "--no-primal", help="skip primal network output", action="store_true"
+    )
+    parser.add_argument(
+        "--no-input", help="skip input network output", action="store_true"
+    )
+    parser.add_argument(
+        "--bbox",
+        help="EPSG:27700 input filter [m]",
+        type=float,
+        nargs=4,
+        metavar=("XMIN", "YMIN", "XMAX", "YMAX"),
+        default=None,
+    )
+    parser.add_argument("--report", help="JSON stage report path", type=str)
+    parser.add_argument("--cache", help="stage cache directory", type=str)
+    parser.add_argument(
+        "--cache-size", help="stage cache size [MB]", type=float, default=CACHE_SIZE
+    )
     args = parser.parse_args()
     return {
         "inpath": args.inpath,
@@ -55,6 +77,13 @@ def get_args():
         "buffer": args.buffer,
         "scale": args.scale,
         "tolerance": args.tolerance,
+        "primal": not args.no_primal,
+        "input": not args.no_input,
+        "bbox": args.bbox,
+        "workers": args.workers,
+        "report": args.report,
+        "cache": args.cache,
+        "cache_size": args.cache_size,
     }
 
 
@@ -217,6 +246,51 @@ def get_voronoi_line(voronoi, boundary, geometry, buffer_size):
     return combine_line(r)
 
 
+def voronoi_frame(this_gs, parameter):
+    """voronoi_frame: return simplified network from LineString GeoSeries using Voronoi
+    polygons
+
+    args:
+      this_gs: LineString GeoSeries
+      parameter: buffer, scale, tolerance, simplify, workers and cache parameter dict
+
+    returns:
+      simplified LineString GeoDataFrame
+
+    """
+    radius = parameter["buffer"]
+    tolerance, scale = parameter["tolerance"], parameter["scale"]
+    with stage("buffer", this_gs) as s:
+        key = get_key(parameter, this_gs, radius, False)
+        fn = partial(get_geometry_buffer, workers=parameter.get("workers", 1))
+        nx_geometry = cached("buffer", parameter, key, fn, this_gs, radius)
+        s.set_output(nx_geometry)
+    key = get_key(parameter, this_gs, radius, tolerance, scale)
+    with stage("voronoi", nx_geometry) as s:
+        nx_boundary = get_geometry_line(nx_geometry)
+        nx_voronoi = cached(
+            "voronoi", parameter, key, get_voronoi, nx_boundary, tolerance, scale
+        )
+        s.set_output(nx_voronoi)
+    with stage("dewhisker", nx_voronoi) as s:
+        r = cached(
+            "dewhisker",
+            parameter,
+            key,
+            get_voronoi_line,
+            nx_voronoi,
+            nx_boundary,
+            nx_geometry,
+            radius,
+        )
+        simplify = parameter["simplify"]
+        if simplify > 0.0:
+            r = r.simplify(simplify)
+        r = r.to_frame("geometry")
+        s.set_output(r)
+    return r
+
+
 def main():
     """main: load GeoJSON file, use Voronoi polygons to simplify network, and output
     the input, simplified and primal network as GeoPKG layers
@@ -229,33 +303,28 @@ def main():
         buffer:      network buffer distance [m]
         scale:       scale distance between edge point to form Voronoi
         tolerance:   snap Voronoi vertices together if their distance is less than this
+        workers:     buffer thread pool size
+        primal:      output primal edge and node layers
+        input:       output input network layer
+        bbox:        optional EPSG:27700 input bounding box filter
+        report:      optional JSON stage report path
 
     returns:
       None
 
     """
-    log("start\t")
+    pd.set_option("display.max_columns", None)
     parameter = get_args()
-    base_nx = get_base_geojson(parameter["inpath"])
-    log("read geojson")
-    outpath = parameter["outpath"]
-    write_dataframe(base_nx, outpath, layer="input")
-    log("process\t")
-    radius = parameter["buffer"]
-    nx_geometry = get_geometry_buffer(base_nx["geometry"], radius=radius)
-    nx_boundary = get_geometry_line(nx_geometry)
-    nx_voronoi = get_voronoi(nx_boundary, parameter["tolerance"], parameter["scale"])
-    log("dewhisker")
-    nx_line = get_voronoi_line(nx_voronoi, nx_boundary, nx_geometry, radius)
-    log("write simple")
-    simplify = parameter["simplify"]
-    if simplify > 0.0:
-        nx_line = nx_line.simplify(simplify)
-    write_dataframe(nx_line.to_frame("geometry"), outpath, layer="line")
-    nx_edge = get_nx(nx_line)
-    log("write primal")
-    write_dataframe(nx_edge.to_frame("geometry"), outpath, layer="primal")
-    log("stop\t")
+    with Report(trace=bool(parameter["report"]), verbose=True) as report:
+        with stage("read") as s:
+            base_nx = get_base_geojson(parameter["inpath"], bbox=parameter["bbox"])
+            s.set_output(base_nx)
+        nx_line = voronoi_frame(base_nx["geometry"], parameter)
+        with stage("write", nx_line):
+            layer = get_output_layer(base_nx, nx_line, parameter)
+            write_layer(layer, parameter["outpath"])
+    if parameter["report"]:
+        report.write(parameter["report"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+"""test_api.py: simplify API parameter tests"""
+
+import pytest
+
+from parenx.api import get_parameter
+
+
+@pytest.mark.parametrize("method", ["tiled", "voronoi"])
+def test_tolerance_list(method):
+    """a tolerance list is rejected for methods other than skeleton"""
+    with pytest.raises(ValueError):
+        get_parameter(method, tolerance=[0.0, 1.0])
+
+
+def test_skeleton_tolerance_list():
+    """a tolerance list is accepted for skeleton"""
+    assert get_parameter("skeleton", tolerance=[0.0, 1.0])["tolerance"] == [0.0, 1.0]
@@ -0,0 +1,26 @@
+"""test_shared.py: shared function regression tests"""
+
+import geopandas as gp
+import pytest
+from shapely import from_wkt
+
+from parenx.shared import get_ends, get_primal
+
+CRS = "EPSG:27700"
+
+
+def test_get_ends_empty_geometry():
+    """empty geometry raises rather than borrowing neighbouring coordinates"""
+    geometry = from_wkt(
+        ["LINESTRING (0 0, 1 1)", "LINESTRING EMPTY", "LINESTRING (5 5, 6 6, 7 7)"]
+    )
+    for i in [geometry, geometry[:2]]:
+        with pytest.raises(ValueError):
+            get_ends(i)
+
+
+def test_get_primal_empty():
+    """empty line returns empty edge and node GeoDataFrames"""
+    edge, node = get_primal(gp.GeoSeries([], crs=CRS))
+    assert edge.empty
+    assert node.empty
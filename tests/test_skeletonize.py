@@ -0,0 +1,37 @@
+"""test_skeletonize.py: skeletonize regression tests"""
+
+import geopandas as gp
+from shapely import LineString
+
+from parenx import simplify
+
+CRS = "EPSG:27700"
+
+
+def get_isolated_nx():
+    """get_isolated_nx: return a 200m line and an isolated 0.5m diagonal line"""
+    line = [
+        LineString([(500000.0, 200000.0), (500200.0, 200000.0)]),
+        LineString([(500900.0, 200000.0), (500900.4, 200000.4)]),
+    ]
+    return gp.GeoSeries(line, crs=CRS)
+
+
+def test_isolated_component():
+    """isolated tiny component skeletonizes to no line rather than an empty line"""
+    this_nx = get_isolated_nx()
+    for parameter in [{}, {"distance": True}]:
+        line, edge, node = simplify(this_nx, primal=True, **parameter)
+        assert len(line) == 1
+        assert not line.is_empty.any()
+        assert len(edge) == 1
+        assert len(node) == 2
+
+
+def test_isolated_component_sweep():
+    """isolated tiny component is dropped from every sweep radius"""
+    r = simplify(get_isolated_nx(), sweep=[6.0, 8.0], primal=True)
+    for line, edge, _ in r.values():
+        assert len(line) == 1
+        assert not line.is_empty.any()
+        assert len(edge) == 1